@@ -1,7 +1,20 @@
+import hashlib
+import io
 import json
+import mmap
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import threading
+import uuid
 import requests
 import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # -------------------------------
 # 🌐 PAGE CONFIG
@@ -41,7 +54,7 @@ st.caption("🎧 Voice → 🧠 ISL Gloss → 🎬 AI Sign Language Video")
 # -------------------------------
 # 🔑 SESSION STATE
 # -------------------------------
-for key in ["transcription", "isl_data", "video_url", "video_status", "prediction_id"]:
+for key in ["transcription", "isl_data", "video_url", "video_status", "prediction_id", "segments"]:
     if key not in st.session_state:
         st.session_state[key] = None
 
@@ -61,32 +74,166 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("**Model Used:**")
     st.markdown("- 🎙️ Whisper Large v3 (Groq)")
-    st.markdown("- 🧠 LLaMA 3.3 70B (Groq)")
+    st.markdown("- 🧠 LLaMA 3.1 8B → 3.3 70B router (Groq)")
     st.markdown("- 🎬 minimax/video-01 (Replicate)")
 
+    st.markdown("---")
+    fanout_mode = st.toggle(
+        "⚡ Sentence fan-out mode",
+        help="Translate and render each sentence in parallel; videos play back as an ordered playlist."
+    )
+
     st.markdown("---")
     if st.button("🔄 Reset All"):
-        for key in ["transcription", "isl_data", "video_url", "video_status", "prediction_id"]:
+        for key in ["transcription", "isl_data", "video_url", "video_status", "prediction_id", "segments"]:
             st.session_state[key] = None
         st.rerun()
 
 
+# -------------------------------
+# 📦 AUDIO SPOOLING
+# -------------------------------
+AUDIO_SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+AUDIO_UPLOAD_MAX_BYTES = 25 * 1024 * 1024
+AUDIO_CHUNK_SIZE = 64 * 1024
+AUDIO_FORMATS = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "m4a": "audio/mp4",
+    "webm": "audio/webm",
+}
+
+
+def spool_audio(audio_file):
+    # Small clips stay in memory; anything larger rolls over to a temp file on disk.
+    spool = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_MEMORY)
+    audio_file.seek(0)
+    shutil.copyfileobj(audio_file, spool, AUDIO_CHUNK_SIZE)
+    spool.flush()
+    return spool
+
+
+def guess_audio_format(audio_file):
+    # Used when the header isn't recognised: trust the upload's name, then its MIME type.
+    name = getattr(audio_file, "name", "") or ""
+    extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    if extension in AUDIO_FORMATS:
+        return extension
+    mime = getattr(audio_file, "type", "") or ""
+    for audio_format, audio_mime in AUDIO_FORMATS.items():
+        if mime == audio_mime:
+            return audio_format
+    return "wav"
+
+
+def detect_audio_format(header, fallback):
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:3] == b"ID3" or header[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[4:8] == b"ftyp":
+        return "m4a"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    return fallback
+
+
+def wav_duration(view):
+    fmt = view.find(b"fmt ", 12, 65536)
+    data = view.find(b"data", 12, 65536)
+    if fmt < 0 or data < 0:
+        return None
+    byte_rate = int.from_bytes(view[fmt + 16:fmt + 20], "little")
+    data_size = int.from_bytes(view[data + 4:data + 8], "little")
+    return data_size / byte_rate if byte_rate else None
+
+
+def inspect_audio(spool, size, fallback):
+    if size > AUDIO_SPOOL_MAX_MEMORY:
+        # Already rolled over to disk: map it instead of reading it back into memory.
+        with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            audio_format = detect_audio_format(view[:16], fallback)
+            duration = wav_duration(view) if audio_format == "wav" else None
+    else:
+        # Header sniffing and WAV chunk lookup only ever look at the first 64 KB.
+        spool.seek(0)
+        view = spool.read(65536)
+        audio_format = detect_audio_format(view[:16], fallback)
+        duration = wav_duration(view) if audio_format == "wav" else None
+    spool.seek(0)
+    return audio_format, duration
+
+
+class MultipartAudioStream:
+    # File-like multipart body with a known length, so requests streams it
+    # block by block with a Content-Length header instead of building it in memory.
+    def __init__(self, spool, size, filename, content_type, fields):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        spool.seek(0)
+        self._parts = [io.BytesIO(head), spool, io.BytesIO(tail)]
+        self._length = len(head) + size + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._parts:
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
 # -------------------------------
 # 🎤 TRANSCRIBE AUDIO
 # -------------------------------
-def transcribe_audio(audio_bytes):
+def transcribe_audio(audio_file):
     try:
-        url = "https://api.groq.com/openai/v1/audio/transcriptions"
-        headers = {"Authorization": f"Bearer {groq_key}"}
-        files = {
-            "file": ("audio.wav", audio_bytes, "audio/wav"),
-            "model": (None, "whisper-large-v3"),
-            "language": (None, "en"),
-            "response_format": (None, "json")
-        }
-        res = requests.post(url, headers=headers, files=files, timeout=30)
-        res.raise_for_status()
-        return res.json().get("text", "")
+        declared_size = getattr(audio_file, "size", None)
+        if declared_size and declared_size > AUDIO_UPLOAD_MAX_BYTES:
+            st.error(f"⚠️ Audio is {declared_size / 1024 / 1024:.1f} MB; the limit is {AUDIO_UPLOAD_MAX_BYTES // 1024 // 1024} MB.")
+            return None
+        with spool_audio(audio_file) as spool:
+            size = spool.tell()
+            if size > AUDIO_UPLOAD_MAX_BYTES:
+                st.error(f"⚠️ Audio is {size / 1024 / 1024:.1f} MB; the limit is {AUDIO_UPLOAD_MAX_BYTES // 1024 // 1024} MB.")
+                return None
+            audio_format, duration = inspect_audio(spool, size, guess_audio_format(audio_file))
+            if duration:
+                st.caption(f"🎧 {audio_format.upper()} audio, {duration / 60:.1f} min")
+            url = "https://api.groq.com/openai/v1/audio/transcriptions"
+            fields = {
+                "model": "whisper-large-v3",
+                "language": "en",
+                "response_format": "json"
+            }
+            body = MultipartAudioStream(spool, size, f"audio.{audio_format}", AUDIO_FORMATS[audio_format], fields)
+            headers = {"Authorization": f"Bearer {groq_key}", "Content-Type": body.content_type}
+            res = get_http_session().post(url, headers=headers, data=body, timeout=(10, 300))
+            res.raise_for_status()
+            return res.json().get("text", "")
     except requests.exceptions.HTTPError as e:
         st.error(f"Groq Transcription HTTP Error {e.response.status_code}: {e.response.text}")
         return None
@@ -95,37 +242,315 @@ def transcribe_audio(audio_bytes):
         return None
 
 
+# -------------------------------
+# 🧭 TRANSLATION MODEL ROUTER
+# -------------------------------
+FAST_ISL_MODEL = "llama-3.1-8b-instant"
+LARGE_ISL_MODEL = "llama-3.3-70b-versatile"
+ROUTER_MAX_FAST_WORDS = 12
+ROUTER_MAX_FAST_CLAUSES = 2
+ROUTER_COMPLEX_WORDS = {
+    "because", "although", "though", "unless", "whether", "while", "whereas",
+    "which", "who", "whom", "whose", "that", "if", "since", "until", "after", "before"
+}
+
+
+@st.cache_resource
+def get_router_stats():
+    # Shared across sessions so the numbers reflect real traffic, not one user.
+    return {
+        "lock": threading.Lock(),
+        "routes": {
+            "fast": {"calls": 0, "latencies": deque(maxlen=200)},
+            "large": {"calls": 0, "latencies": deque(maxlen=200)},
+        },
+        "escalations": 0,
+        "outputs": Counter(),
+        "retries": 0,
+    }
+
+
+def record_route_latency(route, seconds):
+    stats = get_router_stats()
+    with stats["lock"]:
+        stats["routes"][route]["calls"] += 1
+        stats["routes"][route]["latencies"].append(seconds)
+
+
+def record_escalation():
+    stats = get_router_stats()
+    with stats["lock"]:
+        stats["escalations"] += 1
+
+
+def record_translation_outcome(outcome):
+    stats = get_router_stats()
+    with stats["lock"]:
+        stats["outputs"][outcome] += 1
+
+
+def record_translation_retry():
+    stats = get_router_stats()
+    with stats["lock"]:
+        stats["retries"] += 1
+
+
+def groq_error(response):
+    try:
+        return response.json().get("error") or {}
+    except ValueError:
+        return {}
+
+
+def should_escalate_http_error(response):
+    # Bad JSON from the small model (Groq rejects it with 400 json_validate_failed) or the
+    # small model being busy is worth a 70B attempt; auth errors and the like are not.
+    if response.status_code in (429, 503):
+        return True
+    return response.status_code == 400 and groq_error(response).get("code") == "json_validate_failed"
+
+
+def route_translation_model(text):
+    words = re.findall(r"[A-Za-z0-9']+", text.lower())
+    if not words or len(words) > ROUTER_MAX_FAST_WORDS:
+        return "large"
+    clauses = 1 + len(re.findall(r"[,;:]|\s-\s", text)) + len(re.findall(r"[.!?](?=\s+\S)", text))
+    if clauses > ROUTER_MAX_FAST_CLAUSES:
+        return "large"
+    if any(w in ROUTER_COMPLEX_WORDS for w in words):
+        return "large"
+    if any(ch.isdigit() for ch in text):
+        return "large"
+    return "fast"
+
+
+def is_acceptable_isl_output(data, text):
+    if not isinstance(data, dict):
+        return False
+    gloss = data.get("gloss")
+    video_prompt = data.get("video_prompt")
+    if not isinstance(gloss, str) or not isinstance(video_prompt, str):
+        return False
+    gloss_words = gloss.split()
+    source_words = text.split()
+    if not gloss_words or not video_prompt.strip():
+        return False
+    # ISL drops articles/prepositions, so a gloss much longer than the input is a bad sign.
+    if len(gloss_words) > len(source_words) + 2:
+        return False
+    if len(video_prompt.split()) <= len(gloss_words):
+        return False
+    return True
+
+
+def get_router_summary():
+    stats = get_router_stats()
+    with stats["lock"]:
+        summary = {}
+        for route, route_stats in stats["routes"].items():
+            latencies = list(route_stats["latencies"])
+            summary[route] = {
+                "calls": route_stats["calls"],
+                "median_s": statistics.median(latencies) if latencies else None,
+            }
+        fast_calls = stats["routes"]["fast"]["calls"]
+        summary["escalation_rate"] = stats["escalations"] / fast_calls if fast_calls else 0.0
+        outputs = sum(stats["outputs"].values())
+        summary["repair_rate"] = stats["outputs"]["repaired"] / outputs if outputs else 0.0
+        summary["unrepairable"] = stats["outputs"]["unrepairable"]
+        summary["retries"] = stats["retries"]
+    return summary
+
+
+# -------------------------------
+# 🩹 ISL OUTPUT REPAIR & VALIDATION
+# -------------------------------
+ISL_MAX_RETRIES = 1
+
+
+def build_video_prompt(gloss):
+    return (
+        f"A person clearly signing each word in Indian Sign Language: {gloss}. "
+        "Show clear hand shapes, front-facing view, neutral background, professional lighting, "
+        "realistic human, 5-8 seconds"
+    )
+
+
+def close_truncated_json(text):
+    closers = []
+    in_string = escaped = False
+    string_start = 0
+    for index, ch in enumerate(text):
+        if escaped:
+            escaped = False
+        elif ch == "\\" and in_string:
+            escaped = True
+        elif ch == '"':
+            in_string = not in_string
+            string_start = index
+        elif not in_string and ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif not in_string and ch in "}]" and closers:
+            closers.pop()
+    # A value cut off mid-way can't be trusted; drop it and let the schema step fill it back in.
+    if in_string:
+        text = text[:string_start]
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    text = re.sub(r",\s*$", "", text)
+    return text + "".join(reversed(closers))
+
+
+def strip_trailing_commas(text):
+    # Same string-state scan as close_truncated_json, so commas inside values are left alone.
+    out = []
+    in_string = escaped = False
+    trailing_comma = None
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            out.append(ch)
+            continue
+        if ch in "}]" and trailing_comma is not None:
+            del out[trailing_comma]
+        if ch == '"':
+            in_string = True
+        if ch == ",":
+            trailing_comma = len(out)
+        elif not ch.isspace():
+            trailing_comma = None
+        out.append(ch)
+    return "".join(out)
+
+
+def repair_json_text(raw):
+    text = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", raw.strip())
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    end = text.rfind("}")
+    candidates = [text[:end + 1]] if end >= 0 else []
+    candidates.append(close_truncated_json(text))
+    for candidate in candidates:
+        candidate = strip_trailing_commas(candidate)
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    # Last resort: pull the gloss string out of whatever is left.
+    match = re.search(r'"gloss"\s*:\s*"((?:[^"\\]|\\.)*)"', text)
+    if match:
+        try:
+            return {"gloss": json.loads(f'"{match.group(1)}"')}
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+def normalize_isl_output(data):
+    if not isinstance(data, dict):
+        return None, False
+    fixed = False
+    fields = {str(key).strip().lower(): value for key, value in data.items()}
+    if set(fields) != set(data):
+        fixed = True
+    gloss = fields.get("gloss")
+    if isinstance(gloss, list):
+        gloss = " ".join(str(word) for word in gloss)
+        fixed = True
+    if not isinstance(gloss, str) or not gloss.strip():
+        return None, False
+    video_prompt = fields.get("video_prompt")
+    if not isinstance(video_prompt, str) or not video_prompt.strip():
+        video_prompt = build_video_prompt(gloss.strip())
+        fixed = True
+    return {"gloss": gloss.strip(), "video_prompt": video_prompt.strip()}, fixed
+
+
+def validate_isl_output(raw):
+    try:
+        data, repaired = json.loads(raw), False
+    except (json.JSONDecodeError, TypeError):
+        data, repaired = repair_json_text(raw or ""), True
+    result, fixed = normalize_isl_output(data)
+    if result is None:
+        record_translation_outcome("unrepairable")
+    elif repaired or fixed:
+        record_translation_outcome("repaired")
+    else:
+        record_translation_outcome("clean")
+    return result
+
+
 # -------------------------------
 # 🧠 ISL TRANSLATION
 # -------------------------------
+ISL_SYSTEM_PROMPT = (
+    "You are an expert Indian Sign Language (ISL) linguist. "
+    "Convert the given English sentence into ISL. "
+    "ISL follows Subject-Object-Verb order and drops articles/prepositions. "
+    "Return ONLY a valid JSON object with these exact keys:\n"
+    "{\n"
+    '  "gloss": "ISL gloss words in correct order",\n'
+    '  "video_prompt": "A short cinematic description of a person signing each word: [gloss]. '
+    'Show clear hand shapes, front-facing view, neutral background, professional lighting, '
+    'realistic human, 5-8 seconds"\n'
+    "}"
+)
+
+
+def request_isl_translation(model, text):
+    url = "https://api.groq.com/openai/v1/chat/completions"
+    headers = {"Authorization": f"Bearer {groq_key}", "Content-Type": "application/json"}
+    data = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": ISL_SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.3
+    }
+    res = get_http_session().post(url, headers=headers, json=data, timeout=30)
+    if res.status_code == 400 and groq_error(res).get("code") == "json_validate_failed":
+        # Groq rejects malformed JSON instead of returning it; the raw text is still worth repairing.
+        return validate_isl_output(groq_error(res).get("failed_generation"))
+    res.raise_for_status()
+    return validate_isl_output(res.json()["choices"][0]["message"]["content"])
+
+
 def get_isl_translation(text):
     try:
-        system_prompt = (
-            "You are an expert Indian Sign Language (ISL) linguist. "
-            "Convert the given English sentence into ISL. "
-            "ISL follows Subject-Object-Verb order and drops articles/prepositions. "
-            "Return ONLY a valid JSON object with these exact keys:\n"
-            "{\n"
-            '  "gloss": "ISL gloss words in correct order",\n'
-            '  "video_prompt": "A short cinematic description of a person signing each word: [gloss]. '
-            'Show clear hand shapes, front-facing view, neutral background, professional lighting, '
-            'realistic human, 5-8 seconds"\n'
-            "}"
-        )
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {"Authorization": f"Bearer {groq_key}", "Content-Type": "application/json"}
-        data = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            "response_format": {"type": "json_object"},
-            "temperature": 0.3
-        }
-        res = requests.post(url, headers=headers, json=data, timeout=30)
-        res.raise_for_status()
-        return json.loads(res.json()["choices"][0]["message"]["content"])
+        if route_translation_model(text) == "fast":
+            started = time.perf_counter()
+            try:
+                result = request_isl_translation(FAST_ISL_MODEL, text)
+                record_route_latency("fast", time.perf_counter() - started)
+            except requests.exceptions.HTTPError as e:
+                if not should_escalate_http_error(e.response):
+                    raise
+                result = None
+            if is_acceptable_isl_output(result, text):
+                return result
+            # Invalid/low-quality output and an overloaded small model escalate; other errors go to the handlers below.
+            record_escalation()
+
+        # Only the translation step is retried, and only when local repair gave up.
+        for attempt in range(ISL_MAX_RETRIES + 1):
+            if attempt:
+                record_translation_retry()
+            started = time.perf_counter()
+            result = request_isl_translation(LARGE_ISL_MODEL, text)
+            record_route_latency("large", time.perf_counter() - started)
+            if result:
+                return result
+        st.error("ISL Translation Error: the model returned output that could not be repaired.")
+        return None
     except requests.exceptions.HTTPError as e:
         st.error(f"Groq ISL HTTP Error {e.response.status_code}: {e.response.text}")
         return None
@@ -134,6 +559,20 @@ def get_isl_translation(text):
         return None
 
 
+with st.sidebar:
+    router_summary = get_router_summary()
+    with st.expander("📈 Translation Stats"):
+        for route, model in (("fast", FAST_ISL_MODEL), ("large", LARGE_ISL_MODEL)):
+            route_summary = router_summary[route]
+            median = route_summary["median_s"]
+            median_text = f"{median:.2f}s" if median is not None else "—"
+            st.markdown(f"**{route}** (`{model}`): {route_summary['calls']} calls, median {median_text}")
+        st.markdown(f"**Escalation rate:** {router_summary['escalation_rate']:.0%}")
+        st.markdown(f"**JSON repair rate:** {router_summary['repair_rate']:.0%}")
+        st.markdown(f"**Translation retries:** {router_summary['retries']} "
+                    f"({router_summary['unrepairable']} unrepairable outputs)")
+
+
 # -------------------------------
 # 🎬 START VIDEO GENERATION (Async)
 # -------------------------------
@@ -151,7 +590,7 @@ def start_video_generation(prompt):
                 "prompt_optimizer": True
             }
         }
-        res = requests.post(url, headers=headers, json=data, timeout=30)
+        res = get_http_session().post(url, headers=headers, json=data, timeout=30)
         res.raise_for_status()
         prediction = res.json()
         return prediction.get("id"), prediction.get("status")
@@ -180,7 +619,7 @@ def start_video_fallback(prompt):
                 "guidance_scale": 7.5
             }
         }
-        res = requests.post(url, headers=headers, json=data, timeout=30)
+        res = get_http_session().post(url, headers=headers, json=data, timeout=30)
         res.raise_for_status()
         prediction = res.json()
         return prediction.get("id"), prediction.get("status")
@@ -196,7 +635,7 @@ def poll_video_status(prediction_id):
     try:
         url = f"https://api.replicate.com/v1/predictions/{prediction_id}"
         headers = {"Authorization": f"Token {replicate_token}"}
-        res = requests.get(url, headers=headers, timeout=15)
+        res = get_http_session().get(url, headers=headers, timeout=15)
         res.raise_for_status()
         prediction = res.json()
         status = prediction.get("status")
@@ -213,6 +652,365 @@ def poll_video_status(prediction_id):
         return "error", None, str(e)
 
 
+# -------------------------------
+# ⚡ SENTENCE FAN-OUT
+# -------------------------------
+FANOUT_MAX_WORKERS = 4
+FANOUT_MAX_SEGMENTS = 8
+FANOUT_MIN_SENTENCE_WORDS = 2
+SENTENCE_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e"}
+
+
+def split_sentences(text):
+    sentences = []
+    pending = ""
+    for part in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if not part.strip():
+            continue
+        pending = f"{pending} {part.strip()}".strip()
+        last_word = pending.split()[-1].rstrip(".")
+        # "Dr." or an initial like "J." doesn't end a sentence ("I." does); keep reading.
+        is_initial = len(last_word) == 1 and last_word.isupper() and last_word != "I"
+        if pending.endswith(".") and (last_word.lower() in SENTENCE_ABBREVIATIONS or is_initial):
+            continue
+        if len(pending.split()) < FANOUT_MIN_SENTENCE_WORDS:
+            continue
+        sentences.append(pending)
+        pending = ""
+    if pending:
+        if sentences and len(pending.split()) < FANOUT_MIN_SENTENCE_WORDS:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+def group_sentences(sentences):
+    # Keep long transcripts to FANOUT_MAX_SEGMENTS translations/predictions by merging neighbours.
+    count = min(len(sentences), FANOUT_MAX_SEGMENTS)
+    size, extra = divmod(len(sentences), count)
+    groups = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(sentences[start:end])
+        start = end
+    return groups
+
+
+def run_concurrently(fn, items):
+    # Worker threads need the script context so st.error/st.warning still render.
+    ctx = get_script_run_ctx()
+
+    def call(item):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(item)
+
+    with ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS) as pool:
+        return list(pool.map(call, items))
+
+
+def translate_segments(sentences):
+    groups = group_sentences(sentences)
+    texts = [" ".join(group) for group in groups]
+    hits = [lookup_phrase(text) for text in texts]
+    misses = [text for text, hit in zip(texts, hits) if not hit]
+    translations = iter(run_concurrently(get_isl_translation, misses))
+    segments = []
+    for group, text, hit in zip(groups, texts, hits):
+        segments.append({
+            "sentence": text,
+            "merged": len(group),
+            "isl_data": phrase_isl_data(hit) if hit else next(translations),
+            "prediction_id": None,
+            "video_status": "succeeded" if hit else None,
+            "video_url": hit["video"] if hit else None,
+            "error": None,
+        })
+    return segments
+
+
+def start_segment_videos(segments):
+    pending = [seg for seg in segments if seg["isl_data"] and not seg["prediction_id"] and not seg["video_url"]]
+    results = run_concurrently(lambda seg: start_video_generation(seg["isl_data"].get("video_prompt", "")), pending)
+    for seg, (pred_id, status) in zip(pending, results):
+        seg["prediction_id"] = pred_id
+        seg["video_status"] = status if pred_id else "failed"
+
+
+def poll_segment_videos(segments):
+    pending = [
+        seg for seg in segments
+        if seg["prediction_id"] and not seg["video_url"] and seg["video_status"] not in ("failed", "canceled")
+    ]
+    results = run_concurrently(lambda seg: poll_video_status(seg["prediction_id"]), pending)
+    for seg, (status, video_url, error) in zip(pending, results):
+        seg["video_status"] = status
+        if status == "succeeded" and video_url:
+            seg["video_url"] = video_url
+            record_phrase_result(seg["sentence"], seg["isl_data"], video_url)
+        elif status in ("failed", "canceled"):
+            seg["error"] = error
+    return any(
+        seg["prediction_id"] and not seg["video_url"] and seg["video_status"] not in ("failed", "canceled")
+        for seg in segments
+    )
+
+
+def render_segment(slot, index, seg):
+    with slot.container():
+        st.markdown(f"**{index + 1}.** {seg['sentence']}")
+        if seg["video_url"]:
+            st.video(seg["video_url"])
+        elif seg["video_status"] in ("failed", "canceled"):
+            st.error(f"❌ Generation failed: {seg['error'] or 'no prediction started'}")
+        elif seg["prediction_id"]:
+            st.info(f"⏳ Status: **{seg['video_status']}**")
+
+
+# -------------------------------
+# 🔥 STARTUP WARM-UP & PHRASEBOOK
+# -------------------------------
+# Phrasebook files: a JSON list of
+#   {"text": "...", "gloss": "...", "video_prompt": "...", "video": "<local path or URL>"}
+# PHRASEBOOK_PATH is curated by hand and only ever read. Phrases promoted from live
+# traffic go to PHRASEBOOK_LEARNED_PATH. Both are loaded into memory (video bytes
+# included) once per server process.
+PHRASEBOOK_PATH = st.secrets.get("PHRASEBOOK_PATH", "phrasebook.json")
+PHRASEBOOK_LEARNED_PATH = st.secrets.get("PHRASEBOOK_LEARNED_PATH", "phrasebook_learned.json")
+PHRASEBOOK_VIDEO_DIR = st.secrets.get("PHRASEBOOK_VIDEO_DIR", "phrasebook_videos")
+PHRASEBOOK_MAX_ENTRIES = 50
+PHRASEBOOK_MAX_LEARNED = 50
+PHRASEBOOK_MAX_WORDS = 12
+PHRASEBOOK_TRACKED_MAX = 1000
+PHRASEBOOK_MIN_HITS = 3
+PHRASEBOOK_REFRESH_SECONDS = 600
+PHRASEBOOK_DOWNLOAD_TIMEOUT = 10
+PHRASEBOOK_DOWNLOAD_WORKERS = 8
+WARMUP_HOSTS = ["https://api.groq.com", "https://api.replicate.com"]
+
+
+@st.cache_resource
+def get_http_session():
+    # One pooled session per process so TLS connections to Groq/Replicate are reused.
+    # Room for more host pools than WARMUP_HOSTS, so video downloads from other hosts
+    # don't evict the warmed API connections.
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=FANOUT_MAX_WORKERS * 2)
+    session.mount("https://", adapter)
+    return session
+
+
+def normalize_utterance(text):
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+def load_phrase_video(source):
+    if os.path.exists(source):
+        with open(source, "rb") as f:
+            return f.read()
+    res = get_http_session().get(source, timeout=PHRASEBOOK_DOWNLOAD_TIMEOUT)
+    res.raise_for_status()
+    return res.content
+
+
+def load_phrasebook(path, limit, learned):
+    # Returns the loaded entries plus every video source the file references, loaded or not.
+    if not os.path.exists(path):
+        return {}, set()
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    sources = {os.path.abspath(e["video"]) for e in entries if isinstance(e, dict) and isinstance(e.get("video"), str)}
+    entries = entries[:limit]
+
+    def load_entry(entry):
+        try:
+            return normalize_utterance(entry["text"]), {
+                "text": entry["text"],
+                "gloss": entry["gloss"],
+                "video_prompt": entry["video_prompt"],
+                "source": entry["video"],
+                "video": load_phrase_video(entry["video"]),
+                "learned": learned,
+            }
+        except Exception:
+            # A single broken entry shouldn't keep the rest of the phrasebook from loading.
+            return None
+
+    with ThreadPoolExecutor(max_workers=PHRASEBOOK_DOWNLOAD_WORKERS) as pool:
+        return dict(loaded for loaded in pool.map(load_entry, entries) if loaded), sources
+
+
+def save_learned_phrasebook(path, phrasebook):
+    entries = [
+        {"text": e["text"], "gloss": e["gloss"], "video_prompt": e["video_prompt"], "video": e["source"]}
+        for e in phrasebook.values()
+        if e["learned"]
+    ]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def prune_tracked(state):
+    # Caller holds state["lock"]. Keeps traffic/observed memory bounded between refreshes.
+    state["traffic"] = Counter(dict(state["traffic"].most_common(PHRASEBOOK_TRACKED_MAX)))
+    state["observed"] = {key: value for key, value in state["observed"].items() if key in state["traffic"]}
+
+
+def remove_unreferenced_videos(referenced):
+    if not os.path.isdir(PHRASEBOOK_VIDEO_DIR):
+        return
+    for name in os.listdir(PHRASEBOOK_VIDEO_DIR):
+        path = os.path.abspath(os.path.join(PHRASEBOOK_VIDEO_DIR, name))
+        if name.endswith(".mp4") and path not in referenced:
+            os.remove(path)
+
+
+def refresh_phrasebook(state):
+    with state["lock"]:
+        prune_tracked(state)
+        learned = [k for k, e in state["phrasebook"].items() if e["learned"]]
+        candidates = [
+            key for key, hits in state["traffic"].most_common()
+            if hits >= PHRASEBOOK_MIN_HITS and key not in state["phrasebook"] and key in state["observed"]
+        ]
+        # Decide the cut before downloading, so no video is written for an entry that wouldn't survive it.
+        keep = set(sorted(learned + candidates, key=lambda k: state["traffic"][k], reverse=True)[:PHRASEBOOK_MAX_LEARNED])
+        observed = {key: dict(state["observed"][key]) for key in candidates if key in keep}
+    if not observed:
+        return
+
+    promoted = {}
+    os.makedirs(PHRASEBOOK_VIDEO_DIR, exist_ok=True)
+    for key, entry in observed.items():
+        try:
+            # Replicate output URLs expire, so keep our own copy of the video.
+            video = load_phrase_video(entry["video_url"])
+        except Exception:
+            continue
+        video_path = os.path.join(PHRASEBOOK_VIDEO_DIR, hashlib.sha1(key.encode()).hexdigest() + ".mp4")
+        with open(video_path, "wb") as f:
+            f.write(video)
+        promoted[key] = {
+            "text": entry["text"],
+            "gloss": entry["gloss"],
+            "video_prompt": entry["video_prompt"],
+            "source": video_path,
+            "video": video,
+            "learned": True,
+        }
+
+    with state["lock"]:
+        curated = {k: e for k, e in state["phrasebook"].items() if not e["learned"]}
+        learned = {k: e for k, e in state["phrasebook"].items() if e["learned"]}
+        learned.update(promoted)
+        ranked_keys = sorted(learned, key=lambda k: state["traffic"][k], reverse=True)
+        state["phrasebook"] = {**{k: learned[k] for k in ranked_keys[:PHRASEBOOK_MAX_LEARNED]}, **curated}
+        snapshot = dict(state["phrasebook"])
+        referenced = {os.path.abspath(e["source"]) for e in snapshot.values()} | state["pinned_sources"]
+    save_learned_phrasebook(PHRASEBOOK_LEARNED_PATH, snapshot)
+    remove_unreferenced_videos(referenced)
+
+
+def load_phrasebooks(state):
+    session = get_http_session()
+
+    def open_connection(host):
+        try:
+            session.head(host, timeout=5)
+        except requests.exceptions.RequestException:
+            pass
+
+    with ThreadPoolExecutor(max_workers=len(WARMUP_HOSTS)) as pool:
+        list(pool.map(open_connection, WARMUP_HOSTS))
+
+    for path, limit, learned in (
+        (PHRASEBOOK_LEARNED_PATH, PHRASEBOOK_MAX_LEARNED, True),
+        (PHRASEBOOK_PATH, PHRASEBOOK_MAX_ENTRIES, False),
+    ):
+        try:
+            loaded, sources = load_phrasebook(path, limit, learned)
+        except Exception:
+            continue
+        with state["lock"]:
+            state["phrasebook"].update(loaded)
+            if not learned:
+                # Files named by the curated phrasebook are never cleaned up, even if they failed to load.
+                state["pinned_sources"] |= sources
+    state["ready"] = True
+
+
+def phrasebook_refresher(state):
+    load_phrasebooks(state)
+    while True:
+        time.sleep(PHRASEBOOK_REFRESH_SECONDS)
+        try:
+            refresh_phrasebook(state)
+        except Exception:
+            # Background refresh is best-effort; the next cycle will try again.
+            pass
+
+
+@st.cache_resource
+def warm_up():
+    # Everything slow (HEAD probes, video downloads) happens on the background thread,
+    # so the first page load renders immediately and phrases become available as they load.
+    state = {
+        "lock": threading.Lock(),
+        "phrasebook": {},
+        "pinned_sources": set(),
+        "traffic": Counter(),
+        "observed": {},
+        "ready": False,
+    }
+    threading.Thread(target=phrasebook_refresher, args=(state,), daemon=True).start()
+    return state
+
+
+def lookup_phrase(text, count=True):
+    state = warm_up()
+    key = normalize_utterance(text)
+    with state["lock"]:
+        entry = state["phrasebook"].get(key)
+        # Long utterances (whole lectures) will never be phrasebook material, so don't track them.
+        if (count or entry) and len(key.split()) <= PHRASEBOOK_MAX_WORDS:
+            state["traffic"][key] += 1
+            if len(state["traffic"]) > 2 * PHRASEBOOK_TRACKED_MAX:
+                prune_tracked(state)
+        return entry
+
+
+def phrase_isl_data(entry):
+    return {"gloss": entry["gloss"], "video_prompt": entry["video_prompt"]}
+
+
+def record_phrase_result(text, isl_data, video_url):
+    if not isl_data or not isinstance(video_url, str):
+        return
+    state = warm_up()
+    key = normalize_utterance(text)
+    with state["lock"]:
+        if key not in state["traffic"]:
+            return
+        state["observed"][key] = {
+            "text": text,
+            "gloss": isl_data.get("gloss", ""),
+            "video_prompt": isl_data.get("video_prompt", ""),
+            "video_url": video_url,
+        }
+
+
+phrasebook_state = warm_up()
+
+with st.sidebar:
+    if phrasebook_state["ready"]:
+        st.caption(f"📚 Phrasebook: {len(phrasebook_state['phrasebook'])} precomputed phrases")
+    else:
+        st.caption("📚 Phrasebook: loading in the background…")
+
+
 # -------------------------------
 # 🧠 ARCHITECTURE DIAGRAM FUNCTIONS
 # -------------------------------
@@ -603,12 +1401,18 @@ col_main, col_info = st.columns([2, 1])
 with col_main:
     st.subheader("Step 1 — 🎙️ Record Your Voice")
     audio = st.audio_input("Click the mic icon and speak clearly in English")
+    uploaded_audio = st.file_uploader(
+        "…or upload a longer recording (lecture, meeting)",
+        type=list(AUDIO_FORMATS),
+        help=f"Up to {AUDIO_UPLOAD_MAX_BYTES // 1024 // 1024} MB"
+    )
+    audio = audio or uploaded_audio
 
 with col_info:
     st.markdown("""
     <div class="step-box">
     <b>📌 How it works:</b><br><br>
-    1️⃣ Record your voice<br>
+    1️⃣ Record your voice or upload a file<br>
     2️⃣ AI transcribes speech<br>
     3️⃣ Translated to ISL gloss<br>
     4️⃣ Video generated showing signing
@@ -621,11 +1425,23 @@ if audio and not st.session_state.transcription:
         st.error("⚠️ Please enter your Groq API key in the sidebar.")
     else:
         with st.spinner("🎧 Transcribing your audio with Whisper..."):
-            text = transcribe_audio(audio.getvalue())
+            text = transcribe_audio(audio)
         if text:
             st.session_state.transcription = text
-            with st.spinner("🧠 Translating to Indian Sign Language..."):
-                st.session_state.isl_data = get_isl_translation(text)
+            sentences = split_sentences(text)
+            fan_out = fanout_mode and len(sentences) > 1
+            # When fanning out, translate_segments counts each segment instead of the whole transcript.
+            phrase = lookup_phrase(text, count=not fan_out)
+            if phrase:
+                st.session_state.isl_data = phrase_isl_data(phrase)
+                st.session_state.video_url = phrase["video"]
+                st.session_state.video_status = "succeeded"
+            elif fan_out:
+                with st.spinner(f"🧠 Translating {len(sentences)} sentences in parallel..."):
+                    st.session_state.segments = translate_segments(sentences)
+            else:
+                with st.spinner("🧠 Translating to Indian Sign Language..."):
+                    st.session_state.isl_data = get_isl_translation(text)
             st.rerun()
 
 # -------------------------------
@@ -641,7 +1457,17 @@ if st.session_state.transcription:
         st.markdown("**🗣️ Transcribed Speech:**")
         st.success(st.session_state.transcription)
 
-        if st.session_state.isl_data:
+        if st.session_state.segments:
+            merged = sum(seg["merged"] for seg in st.session_state.segments)
+            if merged > len(st.session_state.segments):
+                st.warning(f"⚠️ {merged} sentences were merged into {len(st.session_state.segments)} "
+                           f"segments to stay within the fan-out limit of {FANOUT_MAX_SEGMENTS}.")
+            st.markdown("**📘 ISL Gloss per sentence:**")
+            for i, seg in enumerate(st.session_state.segments):
+                gloss = seg["isl_data"].get("gloss", "N/A") if seg["isl_data"] else "⚠️ translation failed"
+                st.code(f"{i + 1}. {gloss}", language="text")
+
+        elif st.session_state.isl_data:
             st.markdown("**📘 ISL Gloss (sign order):**")
             st.code(st.session_state.isl_data.get("gloss", "N/A"), language="text")
 
@@ -652,7 +1478,42 @@ if st.session_state.transcription:
     with col2:
         st.markdown("**🎬 ISL Sign Language Video:**")
 
-        if not st.session_state.prediction_id and not st.session_state.video_url:
+        if st.session_state.segments:
+            segments = st.session_state.segments
+            needs_video = [seg for seg in segments if seg["isl_data"] and not seg["prediction_id"] and not seg["video_url"]]
+            if needs_video:
+                if st.button("🎬 Generate ISL Videos", use_container_width=True):
+                    if not replicate_token:
+                        st.error("⚠️ Please enter your Replicate token in the sidebar.")
+                    else:
+                        with st.spinner(f"🚀 Submitting {len(needs_video)} video jobs in parallel..."):
+                            start_segment_videos(segments)
+                        st.rerun()
+            if any(seg["prediction_id"] or seg["video_url"] for seg in segments):
+                slots = [st.empty() for _ in segments]
+                for i, seg in enumerate(segments):
+                    render_segment(slots[i], i, seg)
+
+                if any(seg["prediction_id"] and not seg["video_url"] and seg["video_status"] not in ("failed", "canceled")
+                       for seg in segments):
+                    if st.button("🔃 Check Status"):
+                        st.rerun()
+                    progress_bar = st.progress(0)
+                    for tick in range(30):
+                        time.sleep(1)
+                        progress_bar.progress((tick + 1) / 30)
+                        previous = [seg["video_url"] or seg["video_status"] for seg in segments]
+                        still_pending = poll_segment_videos(segments)
+                        for i, seg in enumerate(segments):
+                            if (seg["video_url"] or seg["video_status"]) != previous[i]:
+                                render_segment(slots[i], i, seg)
+                        if not still_pending:
+                            progress_bar.progress(1.0)
+                            break
+                    else:
+                        st.warning("Still processing... click 'Check Status' to refresh.")
+
+        elif not st.session_state.prediction_id and not st.session_state.video_url:
             if st.button("🎬 Generate ISL Video", use_container_width=True):
                 if not replicate_token:
                     st.error("⚠️ Please enter your Replicate token in the sidebar.")
@@ -682,6 +1543,7 @@ if st.session_state.transcription:
                     s, v, e = poll_video_status(st.session_state.prediction_id)
                     if s == "succeeded" and v:
                         st.session_state.video_url = v
+                        record_phrase_result(st.session_state.transcription, st.session_state.isl_data, v)
                         st.session_state.video_status = "succeeded"
                         progress_bar.progress(1.0)
                         st.rerun()
@@ -695,6 +1557,7 @@ if st.session_state.transcription:
 
             elif status == "succeeded" and video_url:
                 st.session_state.video_url = video_url
+                record_phrase_result(st.session_state.transcription, st.session_state.isl_data, video_url)
                 st.rerun()
 
             elif status == "failed":
@@ -704,7 +1567,10 @@ if st.session_state.transcription:
         if st.session_state.video_url:
             st.markdown('<p class="status-success">✅ Video Ready!</p>', unsafe_allow_html=True)
             st.video(st.session_state.video_url)
-            st.markdown(f"[📥 Download Video]({st.session_state.video_url})", unsafe_allow_html=False)
+            if isinstance(st.session_state.video_url, bytes):
+                st.download_button("📥 Download Video", st.session_state.video_url, file_name="isl_sign.mp4", mime="video/mp4")
+            else:
+                st.markdown(f"[📥 Download Video]({st.session_state.video_url})", unsafe_allow_html=False)
 
 # -------------------------------
 # 🧠 ARCHITECTURE VISUALIZATION SECTION